@@ -5,14 +5,29 @@ Detect OpenRouter free models, track changes, and persist daily snapshots.
 
 from __future__ import annotations
 
+import hashlib
+import heapq
 import json
 import os
+import re
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from decimal import Decimal, InvalidOperation
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Set, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import ijson
+except ImportError:  # pragma: no cover - ijson is an optional memory saving
+    ijson = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speedup
+    orjson = None
 
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/models"
 OPENROUTER_CHAT_URL = "https://openrouter.ai/api/v1/chat/completions"
@@ -20,11 +35,62 @@ KNOWN_MODELS_FILE = Path("known_free_models.json")
 MODEL_CHANGES_FILE = Path("model_changes.json")
 MODEL_LAYER_FILE = Path("model_layer.json")
 DAILY_SNAPSHOT_DIR = Path("daily_snapshots")
+FETCH_CACHE_FILE = Path(".openrouter_cache.meta")
 REQUEST_TIMEOUT = 30
 RANKER_REQUEST_TIMEOUT = 90
 MAX_PROFILE_CANDIDATES = 8
 LONG_CONTEXT_THRESHOLD = 65536
 DEFAULT_CAPABILITY_RANKER_MODEL = "openai/gpt-oss-120b:free"
+HTTP_POOL_MAXSIZE = 4
+HTTP_RETRY_TOTAL = 3
+HTTP_RETRY_BACKOFF = 0.3
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+ZERO_PRICE_LITERALS = frozenset({"0", "0.0", "0.00", "0e0"})
+GITHUB_OUTPUT_BUFFER: List[str] = []
+REASONING_PATTERN = re.compile(
+    "|".join(("reasoning", "deepseek-r1", "r1", "qwq", "think", "o1", "reasoner")),
+    re.IGNORECASE,
+)
+# Match the top-level timestamp line of each indent-2 JSON artifact, so the
+# timestamp can be swapped without re-parsing the file.
+KNOWN_MODELS_STAMP_PATTERN = re.compile(rb'^(  "last_updated": )(?:null|"[^"\n]*")', re.MULTILINE)
+MODEL_CHANGES_STAMP_PATTERN = re.compile(rb'^(  "checked_at": )(?:null|"[^"\n]*")', re.MULTILINE)
+MODEL_LAYER_STAMP_PATTERN = re.compile(rb'^(  "updated_at": )(?:null|"[^"\n]*")', re.MULTILINE)
+
+
+@dataclass(frozen=True, slots=True)
+class ModelInfo:
+    # Fields are declared in alphabetical order because orjson serializes
+    # dataclasses in declaration order regardless of OPT_SORT_KEYS.
+    architecture: Any
+    context_length: Any
+    description: Any
+    id: str
+    name: Optional[str]
+    per_request_limits: Any
+    pricing: Dict[str, Any]
+    top_provider: Any
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+def create_http_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=Retry(
+            total=HTTP_RETRY_TOTAL,
+            backoff_factor=HTTP_RETRY_BACKOFF,
+            status_forcelist=HTTP_RETRY_STATUSES,
+        ),
+    )
+    session.mount("https://", adapter)
+    return session
+
+
+HTTP_SESSION = create_http_session()
 
 
 def now_utc() -> datetime:
@@ -35,62 +101,213 @@ def iso_utc(dt: datetime) -> str:
     return dt.isoformat().replace("+00:00", "Z")
 
 
-def parse_price(value: Any) -> Optional[Decimal]:
-    if value is None:
+def json_default(value: Any) -> Any:
+    if isinstance(value, ModelInfo):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_json(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(
+            payload,
+            default=json_default,
+            option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS,
+        )
+    return json.dumps(
+        payload,
+        default=json_default,
+        ensure_ascii=False,
+        indent=2,
+        sort_keys=True,
+    ).encode("utf-8")
+
+
+def loads_json(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def replace_json_stamp(data: bytes, pattern: "re.Pattern[bytes]", value: Optional[str]) -> bytes:
+    stamp = json.dumps(value).encode("utf-8")
+    return pattern.sub(lambda match: match.group(1) + stamp, data, count=1)
+
+
+def digest_path(path: Path) -> Path:
+    return path.with_suffix(".sha256")
+
+
+def read_digest(path: Path) -> Optional[str]:
+    sidecar = digest_path(path)
+    if not sidecar.exists():
         return None
+    return sidecar.read_text(encoding="utf-8").strip() or None
+
+
+def atomic_write_if_changed(
+    path: Path,
+    body: bytes,
+    digest: Optional[str] = None,
+    stamp_pattern: Optional["re.Pattern[bytes]"] = None,
+    stamp: Optional[str] = None,
+) -> bool:
+    # body carries a null timestamp, so its digest only changes with content;
+    # the timestamp is filled in just before writing.
+    if digest is None:
+        digest = hashlib.sha256(body).hexdigest()
+
+    if path.exists():
+        previous = read_digest(path)
+        if previous is None:
+            # No sidecar yet: compare with the stored file once and record
+            # its digest so later runs only need to read the sidecar.
+            with path.open("rb") as file:
+                existing = file.read()
+            if stamp_pattern is not None:
+                existing = replace_json_stamp(existing, stamp_pattern, None)
+            if existing == body:
+                digest_path(path).write_text(f"{digest}\n", encoding="utf-8")
+                return False
+        elif previous == digest:
+            return False
 
-    if isinstance(value, (int, float, Decimal)):
-        try:
-            return Decimal(str(value))
-        except InvalidOperation:
-            return None
+    data = body if stamp_pattern is None else replace_json_stamp(body, stamp_pattern, stamp)
+    temp_path = path.with_name(f"{path.name}.tmp")
+    with temp_path.open("wb") as file:
+        file.write(data)
+    os.replace(temp_path, path)
+    digest_path(path).write_text(f"{digest}\n", encoding="utf-8")
+
+    return True
+
+
+def is_zero_price(value: Any) -> bool:
+    if isinstance(value, bool):
+        return False
+
+    if isinstance(value, (int, float)):
+        return value == 0
 
     if isinstance(value, str):
         text = value.strip()
-        if not text:
-            return None
+        if text in ZERO_PRICE_LITERALS:
+            return True
         try:
-            return Decimal(text)
-        except InvalidOperation:
-            return None
+            return float(text) == 0
+        except ValueError:
+            return False
 
-    return None
+    return False
+
+
+def load_fetch_cache() -> Dict[str, str]:
+    if not FETCH_CACHE_FILE.exists():
+        return {}
+
+    try:
+        with FETCH_CACHE_FILE.open("rb") as file:
+            data = loads_json(file.read())
+    except ValueError:
+        return {}
+
+    if not isinstance(data, dict):
+        return {}
+    return {key: value for key, value in data.items() if key in {"etag", "last_modified"} and isinstance(value, str)}
+
+
+def save_fetch_cache(cache: Dict[str, str]) -> bool:
+    body = dumps_json(cache)
+    if FETCH_CACHE_FILE.exists():
+        with FETCH_CACHE_FILE.open("rb") as file:
+            if file.read() == body:
+                return False
 
+    with FETCH_CACHE_FILE.open("wb") as file:
+        file.write(body)
 
-def fetch_models() -> List[Dict[str, Any]]:
-    headers: Dict[str, str] = {}
+    return True
+
+
+def fetch_models(cache: Dict[str, str]) -> Tuple[Optional[Iterator[Dict[str, Any]]], Dict[str, str]]:
+    headers: Dict[str, str] = {"Accept-Encoding": "gzip"}
     api_key = os.environ.get("OPENROUTER_API_KEY")
     if api_key:
         headers["Authorization"] = f"Bearer {api_key}"
+    if cache.get("etag"):
+        headers["If-None-Match"] = cache["etag"]
+    if cache.get("last_modified"):
+        headers["If-Modified-Since"] = cache["last_modified"]
+
+    response = HTTP_SESSION.get(
+        OPENROUTER_API_URL,
+        headers=headers,
+        timeout=REQUEST_TIMEOUT,
+        stream=True,
+    )
+    if response.status_code == 304:
+        response.close()
+        return None, cache
 
-    response = requests.get(OPENROUTER_API_URL, headers=headers, timeout=REQUEST_TIMEOUT)
-    response.raise_for_status()
+    try:
+        response.raise_for_status()
+    except requests.HTTPError:
+        response.close()
+        raise
 
-    data = response.json()
-    models = data.get("data", [])
-    if not isinstance(models, list):
+    new_cache: Dict[str, str] = {}
+    if response.headers.get("ETag"):
+        new_cache["etag"] = response.headers["ETag"]
+    if response.headers.get("Last-Modified"):
+        new_cache["last_modified"] = response.headers["Last-Modified"]
+
+    return iter_response_models(response), new_cache
+
+
+def iter_response_models(response: requests.Response) -> Iterator[Dict[str, Any]]:
+    with response:
+        if ijson is None:
+            data = loads_json(response.content)
+            models = data.get("data", [])
+            if not isinstance(models, list):
+                raise ValueError("Unexpected API response: data is not a list")
+            yield from models
+            return
+
+        # Yield models one by one straight off the socket so the paid models
+        # never have to be held in memory together.
+        response.raw.decode_content = True
+        events = checked_catalog_events(ijson.parse(response.raw, use_float=True))
+        yield from ijson.items(events, "data.item")
+
+
+def checked_catalog_events(events: Iterator[Tuple[str, str, Any]]) -> Iterator[Tuple[str, str, Any]]:
+    # ijson.items yields nothing for a missing or non-array data value, which
+    # would otherwise look like a catalog with zero free models.
+    seen_data = False
+    for prefix, event, value in events:
+        if prefix == "data" and not seen_data:
+            if event != "start_array":
+                raise ValueError("Unexpected API response: data is not a list")
+            seen_data = True
+        yield prefix, event, value
+
+    if not seen_data:
         raise ValueError("Unexpected API response: data is not a list")
 
-    return models
-
 
 def is_free_model(model: Dict[str, Any]) -> bool:
     pricing = model.get("pricing") or {}
     if not isinstance(pricing, dict) or not pricing:
         return False
 
-    prompt_price = parse_price(pricing.get("prompt"))
-    completion_price = parse_price(pricing.get("completion"))
-
-    if prompt_price is None or completion_price is None:
-        return False
-
-    if prompt_price != 0 or completion_price != 0:
+    # prompt and completion must be present; every field, including these
+    # two, is then checked for zero below.
+    if pricing.get("prompt") is None or pricing.get("completion") is None:
         return False
 
     for value in pricing.values():
-        parsed = parse_price(value)
-        if parsed is None or parsed != 0:
+        if not is_zero_price(value):
             return False
 
     return True
@@ -102,17 +319,17 @@ def normalize_pricing(pricing: Any) -> Dict[str, Any]:
     return {str(key): pricing[key] for key in sorted(pricing.keys())}
 
 
-def extract_model_info(model: Dict[str, Any]) -> Dict[str, Any]:
-    return {
-        "id": model.get("id"),
-        "name": model.get("name"),
-        "description": model.get("description", ""),
-        "context_length": model.get("context_length"),
-        "pricing": normalize_pricing(model.get("pricing")),
-        "top_provider": model.get("top_provider", {}),
-        "per_request_limits": model.get("per_request_limits"),
-        "architecture": model.get("architecture", {}),
-    }
+def extract_model_info(model: Dict[str, Any]) -> ModelInfo:
+    return ModelInfo(
+        architecture=model.get("architecture", {}),
+        context_length=model.get("context_length"),
+        description=model.get("description", ""),
+        id=model.get("id"),
+        name=model.get("name"),
+        per_request_limits=model.get("per_request_limits"),
+        pricing=normalize_pricing(model.get("pricing")),
+        top_provider=model.get("top_provider", {}),
+    )
 
 
 def safe_int(value: Any) -> Optional[int]:
@@ -143,71 +360,47 @@ def ensure_str_list(values: Any) -> List[str]:
     return sorted(set(output))
 
 
-def compute_model_tags(model_id: str, info: Dict[str, Any]) -> List[str]:
-    text = " ".join(
-        str(part).lower()
-        for part in [model_id, info.get("name"), info.get("description")]
-        if isinstance(part, str)
-    )
-
-    architecture = info.get("architecture", {})
-    if not isinstance(architecture, dict):
-        architecture = {}
-    input_modalities = ensure_str_list(architecture.get("input_modalities"))
-
-    top_provider = info.get("top_provider", {})
-    if not isinstance(top_provider, dict):
-        top_provider = {}
-
-    context_length = safe_int(info.get("context_length")) or 0
-    tags: Set[str] = {"text"}
-
-    reasoning_keywords = (
-        "reasoning",
-        "deepseek-r1",
-        "r1",
-        "qwq",
-        "think",
-        "o1",
-        "reasoner",
-    )
-    if any(keyword in text for keyword in reasoning_keywords):
-        tags.add("reasoning")
-
-    if context_length >= LONG_CONTEXT_THRESHOLD:
-        tags.add("long_context")
-
-    if "image" in input_modalities:
-        tags.add("vision")
-
-    if top_provider.get("is_moderated") is True:
-        tags.add("moderated")
-
-    return sorted(tags)
-
-
-def build_model_index(current_models: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+def build_model_index(model_ids: List[str], current_models: Dict[str, ModelInfo]) -> Dict[str, Dict[str, Any]]:
     model_index: Dict[str, Dict[str, Any]] = {}
 
-    for model_id in sorted(current_models.keys()):
+    for model_id in model_ids:
         info = current_models[model_id]
-        architecture = info.get("architecture", {})
+        name = info.name
+        description = info.description
+
+        architecture = info.architecture
         if not isinstance(architecture, dict):
             architecture = {}
+        input_modalities = ensure_str_list(architecture.get("input_modalities"))
 
-        top_provider = info.get("top_provider", {})
+        top_provider = info.top_provider
         if not isinstance(top_provider, dict):
             top_provider = {}
+        is_moderated = top_provider.get("is_moderated") is True
+
+        context_length = safe_int(info.context_length)
+        text = " ".join(part for part in (model_id, name, description) if isinstance(part, str))
+
+        # Appended in alphabetical order so the list is already sorted.
+        tags: List[str] = []
+        if (context_length or 0) >= LONG_CONTEXT_THRESHOLD:
+            tags.append("long_context")
+        if is_moderated:
+            tags.append("moderated")
+        if REASONING_PATTERN.search(text):
+            tags.append("reasoning")
+        tags.append("text")
+        if "image" in input_modalities:
+            tags.append("vision")
 
-        context_length = safe_int(info.get("context_length"))
         model_index[model_id] = {
             "id": model_id,
-            "name": info.get("name") or model_id,
+            "name": name or model_id,
             "context_length": context_length,
-            "input_modalities": ensure_str_list(architecture.get("input_modalities")),
+            "input_modalities": input_modalities,
             "output_modalities": ensure_str_list(architecture.get("output_modalities")),
-            "is_moderated": top_provider.get("is_moderated") is True,
-            "tags": compute_model_tags(model_id, info),
+            "is_moderated": is_moderated,
+            "tags": tags,
         }
 
     return model_index
@@ -296,7 +489,7 @@ def rank_models_by_capability_with_llm(model_index: Dict[str, Dict[str, Any]]) -
         return None
 
     rank_input: List[Dict[str, Any]] = []
-    for model_id in sorted(model_index.keys()):
+    for model_id in model_index:
         item = model_index[model_id]
         rank_input.append(
             {
@@ -336,14 +529,14 @@ def rank_models_by_capability_with_llm(model_index: Dict[str, Dict[str, Any]]) -
     }
 
     try:
-        response = requests.post(
+        response = HTTP_SESSION.post(
             OPENROUTER_CHAT_URL,
             headers=headers,
             json=request_payload,
             timeout=RANKER_REQUEST_TIMEOUT,
         )
         response.raise_for_status()
-        payload = response.json()
+        payload = loads_json(response.content)
     except Exception as exc:
         print(f"Capability ranking request failed: {exc}")
         return None
@@ -369,7 +562,7 @@ def rank_models_by_capability_with_llm(model_index: Dict[str, Dict[str, Any]]) -
         return None
 
     seen = set(ranked_ids)
-    for model_id in sorted(model_index.keys()):
+    for model_id in model_index:
         if model_id not in seen:
             ranked_ids.append(model_id)
 
@@ -389,39 +582,53 @@ def reorder_candidates(candidates: List[str], rank_index: Dict[str, int]) -> Lis
 
 
 def build_profiles(model_index: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
-    all_ids = sorted(model_index.keys())
-
-    default_candidates = sorted(
-        all_ids,
-        key=lambda model_id: (
-            1 if "reasoning" in model_index[model_id]["tags"] else 0,
-            0 if model_index[model_id]["is_moderated"] else 1,
-            -context_for_sort(model_index[model_id]),
-            model_id,
-        ),
-    )[:MAX_PROFILE_CANDIDATES]
+    # (model_id, entry) pairs so the selection keys below do not repeat the
+    # model_index lookup for every comparison.
+    pool = list(model_index.items())
+
+    default_candidates = [
+        model_id
+        for model_id, _ in heapq.nsmallest(
+            MAX_PROFILE_CANDIDATES,
+            pool,
+            key=lambda item: (
+                1 if "reasoning" in item[1]["tags"] else 0,
+                0 if item[1]["is_moderated"] else 1,
+                -context_for_sort(item[1]),
+                item[0],
+            ),
+        )
+    ]
 
-    reasoning_pool = [model_id for model_id in all_ids if "reasoning" in model_index[model_id]["tags"]]
-    reasoning_candidates = sorted(
-        reasoning_pool,
-        key=lambda model_id: (
-            0 if model_index[model_id]["is_moderated"] else 1,
-            -context_for_sort(model_index[model_id]),
-            model_id,
-        ),
-    )[:MAX_PROFILE_CANDIDATES]
+    reasoning_pool = [item for item in pool if "reasoning" in item[1]["tags"]]
+    reasoning_candidates = [
+        model_id
+        for model_id, _ in heapq.nsmallest(
+            MAX_PROFILE_CANDIDATES,
+            reasoning_pool,
+            key=lambda item: (
+                0 if item[1]["is_moderated"] else 1,
+                -context_for_sort(item[1]),
+                item[0],
+            ),
+        )
+    ]
     if not reasoning_candidates:
         reasoning_candidates = list(default_candidates)
 
-    long_context_pool = [model_id for model_id in all_ids if "long_context" in model_index[model_id]["tags"]]
-    long_context_candidates = sorted(
-        long_context_pool or all_ids,
-        key=lambda model_id: (
-            -context_for_sort(model_index[model_id]),
-            0 if model_index[model_id]["is_moderated"] else 1,
-            model_id,
-        ),
-    )[:MAX_PROFILE_CANDIDATES]
+    long_context_pool = [item for item in pool if "long_context" in item[1]["tags"]]
+    long_context_candidates = [
+        model_id
+        for model_id, _ in heapq.nsmallest(
+            MAX_PROFILE_CANDIDATES,
+            long_context_pool or pool,
+            key=lambda item: (
+                -context_for_sort(item[1]),
+                0 if item[1]["is_moderated"] else 1,
+                item[0],
+            ),
+        )
+    ]
 
     ranked_ids = rank_models_by_capability_with_llm(model_index)
     if ranked_ids:
@@ -449,8 +656,8 @@ def build_profiles(model_index: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str
     }
 
 
-def build_model_layer(current_models: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
-    model_index = build_model_index(current_models)
+def build_model_layer(model_ids: List[str], current_models: Dict[str, ModelInfo]) -> Dict[str, Any]:
+    model_index = build_model_index(model_ids, current_models)
     profiles = build_profiles(model_index)
     return {
         "schema_version": "1.0",
@@ -468,106 +675,136 @@ def build_model_layer(current_models: Dict[str, Dict[str, Any]]) -> Dict[str, An
     }
 
 
-def comparable_model_layer(layer: Dict[str, Any]) -> Dict[str, Any]:
-    comparable = dict(layer)
-    comparable.pop("updated_at", None)
-    return comparable
-
-
-def save_model_layer(layer: Dict[str, Any]) -> bool:
-    existing: Optional[Dict[str, Any]] = None
-    if MODEL_LAYER_FILE.exists():
-        with MODEL_LAYER_FILE.open("r", encoding="utf-8") as file:
-            existing = json.load(file)
-
-    if existing and comparable_model_layer(existing) == comparable_model_layer(layer):
-        return False
-
-    output = dict(layer)
-    output["updated_at"] = iso_utc(now_utc())
-    with MODEL_LAYER_FILE.open("w", encoding="utf-8") as file:
-        json.dump(output, file, ensure_ascii=False, indent=2, sort_keys=True)
-
-    return True
+def save_model_layer(layer: Dict[str, Any], updated_at: str) -> bool:
+    # build_model_layer leaves updated_at as None, so the serialized layer is
+    # already the timestamp-free body and needs no copy or second pass.
+    return atomic_write_if_changed(
+        MODEL_LAYER_FILE,
+        dumps_json(layer),
+        stamp_pattern=MODEL_LAYER_STAMP_PATTERN,
+        stamp=updated_at,
+    )
 
 
-def load_known_models() -> Dict[str, Any]:
+def load_known_models() -> Dict[str, ModelInfo]:
     if not KNOWN_MODELS_FILE.exists():
-        return {"models": {}, "last_updated": None}
+        return {}
 
-    with KNOWN_MODELS_FILE.open("r", encoding="utf-8") as file:
-        return json.load(file)
+    with KNOWN_MODELS_FILE.open("rb") as file:
+        known_data = loads_json(file.read())
+
+    stored_models = known_data.get("models", {})
+    if not isinstance(stored_models, dict):
+        return {}
+    return {model_id: extract_model_info(info) for model_id, info in stored_models.items() if isinstance(info, dict)}
 
 
-def save_known_models(models: Dict[str, Dict[str, Any]]) -> None:
+def save_known_models(models: Dict[str, ModelInfo], last_updated: str) -> bool:
     payload = {
-        "last_updated": iso_utc(now_utc()),
+        "last_updated": None,
         "model_count": len(models),
         "models": models,
     }
-    with KNOWN_MODELS_FILE.open("w", encoding="utf-8") as file:
-        json.dump(payload, file, ensure_ascii=False, indent=2, sort_keys=True)
+    return atomic_write_if_changed(
+        KNOWN_MODELS_FILE,
+        dumps_json(payload),
+        stamp_pattern=KNOWN_MODELS_STAMP_PATTERN,
+        stamp=last_updated,
+    )
 
 
-def get_free_models() -> Dict[str, Dict[str, Any]]:
-    free_models: Dict[str, Dict[str, Any]] = {}
+def get_free_models(
+    known_models: Dict[str, ModelInfo],
+) -> Tuple[List[str], Dict[str, ModelInfo], Dict[str, str]]:
+    # Only revalidate when there is a stored baseline to fall back on.
+    cache = load_fetch_cache() if known_models else {}
+    models, fetch_cache = fetch_models(cache)
+    if models is None:
+        print("Model list not modified upstream; reusing known free models.")
+        sorted_ids = sorted(known_models.keys())
+        return sorted_ids, {model_id: known_models[model_id] for model_id in sorted_ids}, fetch_cache
 
-    for model in fetch_models():
+    free_models: Dict[str, ModelInfo] = {}
+    for model in models:
         model_id = model.get("id")
         if not model_id:
             continue
         if is_free_model(model):
             free_models[model_id] = extract_model_info(model)
 
-    return {model_id: free_models[model_id] for model_id in sorted(free_models.keys())}
-
-
-def compare_models(current: Dict[str, Dict[str, Any]], known: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
-    current_ids = set(current.keys())
-    known_ids = set(known.keys())
-
-    new_ids = sorted(current_ids - known_ids)
-    removed_ids = sorted(known_ids - current_ids)
-    unchanged_ids = sorted(current_ids & known_ids)
+    sorted_ids = sorted(free_models.keys())
+    return sorted_ids, {model_id: free_models[model_id] for model_id in sorted_ids}, fetch_cache
+
+
+def compare_models(
+    current_ids: List[str],
+    current: Dict[str, ModelInfo],
+    known_ids: List[str],
+    known: Dict[str, ModelInfo],
+) -> Dict[str, Any]:
+    # Both id lists are sorted, so a single merge pass splits them into
+    # added, removed, and unchanged ids without building sets.
+    new_ids: List[str] = []
+    removed_ids: List[str] = []
+    unchanged_ids: List[str] = []
+
+    i = j = 0
+    while i < len(current_ids) and j < len(known_ids):
+        current_id = current_ids[i]
+        known_id = known_ids[j]
+        if current_id == known_id:
+            unchanged_ids.append(current_id)
+            i += 1
+            j += 1
+        elif current_id < known_id:
+            new_ids.append(current_id)
+            i += 1
+        else:
+            removed_ids.append(known_id)
+            j += 1
+    new_ids.extend(current_ids[i:])
+    removed_ids.extend(known_ids[j:])
 
     return {
+        "new_ids": new_ids,
+        "removed_ids": removed_ids,
         "new": {model_id: current[model_id] for model_id in new_ids},
         "removed": {model_id: known[model_id] for model_id in removed_ids},
         "unchanged": unchanged_ids,
     }
 
 
-def format_model_list(models: Dict[str, Dict[str, Any]]) -> str:
-    if not models:
+def format_model_list(model_ids: List[str], models: Dict[str, ModelInfo]) -> str:
+    if not model_ids:
         return "None"
 
-    lines: List[str] = []
-    for model_id in sorted(models.keys()):
+    # pricing keys are already sorted by normalize_pricing.
+    blocks: List[str] = []
+    for model_id in model_ids:
         info = models[model_id]
-        name = info.get("name") or model_id
-        context_length = info.get("context_length", "unknown")
-        pricing = info.get("pricing", {})
-
-        lines.append(f"- **{name}** (`{model_id}`)")
-        if isinstance(context_length, int):
-            lines.append(f"  - Context length: {context_length:,}")
-        else:
-            lines.append(f"  - Context length: {context_length}")
-        lines.append(
-            "  - Pricing: "
-            + ", ".join(f"{k}={pricing[k]}" for k in sorted(pricing.keys()))
+        name = info.name or model_id
+        context_length = info.context_length
+        context_text = f"{context_length:,}" if isinstance(context_length, int) else str(context_length)
+        pricing_text = ", ".join(f"{key}={value}" for key, value in info.pricing.items())
+        blocks.append(
+            f"- **{name}** (`{model_id}`)\n"
+            f"  - Context length: {context_text}\n"
+            f"  - Pricing: {pricing_text}"
         )
 
-    return "\n".join(lines)
-
+    return "\n".join(blocks)
 
-def create_issue_content(diff: Dict[str, Any], current_models: Dict[str, Dict[str, Any]]) -> str:
-    now = now_utc()
 
+def create_issue_content(
+    diff: Dict[str, Any],
+    current_ids: List[str],
+    current_models: Dict[str, ModelInfo],
+    detected_at: datetime,
+) -> str:
     content = [
         "# OpenRouter Free Models Update",
         "",
-        f"Detection time (UTC): {now.strftime('%Y-%m-%d %H:%M:%S')}",
+        f"Detection time (UTC): {detected_at.strftime('%Y-%m-%d %H:%M:%S')}",
         "",
         "## Summary",
         f"- Current free models: **{len(current_models)}**",
@@ -577,10 +814,10 @@ def create_issue_content(diff: Dict[str, Any], current_models: Dict[str, Dict[st
     ]
 
     if diff["new"]:
-        content.extend(["## Added", format_model_list(diff["new"]), ""])
+        content.extend(["## Added", format_model_list(diff["new_ids"], diff["new"]), ""])
 
     if diff["removed"]:
-        content.extend(["## Removed", format_model_list(diff["removed"]), ""])
+        content.extend(["## Removed", format_model_list(diff["removed_ids"], diff["removed"]), ""])
 
     content.extend(
         [
@@ -588,7 +825,7 @@ def create_issue_content(diff: Dict[str, Any], current_models: Dict[str, Dict[st
             "<details>",
             "<summary>Expand full list</summary>",
             "",
-            format_model_list(current_models),
+            format_model_list(current_ids, current_models),
             "",
             "</details>",
         ]
@@ -597,9 +834,13 @@ def create_issue_content(diff: Dict[str, Any], current_models: Dict[str, Dict[st
     return "\n".join(content)
 
 
-def write_model_changes_file(diff: Dict[str, Any], current_models: Dict[str, Dict[str, Any]]) -> None:
+def write_model_changes_file(
+    diff: Dict[str, Any],
+    current_models: Dict[str, ModelInfo],
+    checked_at: str,
+) -> bool:
     payload = {
-        "checked_at": iso_utc(now_utc()),
+        "checked_at": None,
         "totals": {
             "current": len(current_models),
             "added": len(diff["new"]),
@@ -612,88 +853,121 @@ def write_model_changes_file(diff: Dict[str, Any], current_models: Dict[str, Dic
         "current_models": current_models,
     }
 
-    with MODEL_CHANGES_FILE.open("w", encoding="utf-8") as file:
-        json.dump(payload, file, ensure_ascii=False, indent=2, sort_keys=True)
+    return atomic_write_if_changed(
+        MODEL_CHANGES_FILE,
+        dumps_json(payload),
+        stamp_pattern=MODEL_CHANGES_STAMP_PATTERN,
+        stamp=checked_at,
+    )
+
 
+def model_ids_fingerprint(model_ids: List[str]) -> str:
+    return hashlib.sha256("\n".join(model_ids).encode("utf-8")).hexdigest()
 
-def save_daily_snapshot(diff: Dict[str, Any], current_models: Dict[str, Dict[str, Any]]) -> Tuple[Path, bool]:
-    date_utc = now_utc().strftime("%Y-%m-%d")
+
+def save_daily_snapshot(
+    date_utc: str,
+    diff: Dict[str, Any],
+    current_ids: List[str],
+    current_models: Dict[str, ModelInfo],
+) -> Tuple[Path, bool]:
     DAILY_SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
     snapshot_file = DAILY_SNAPSHOT_DIR / f"{date_utc}.json"
 
+    # Re-runs on the same day usually see the same model ids; the sidecar
+    # fingerprint lets them skip building and comparing the full snapshot.
+    fingerprint = model_ids_fingerprint(current_ids)
+    if snapshot_file.exists() and read_digest(snapshot_file) == fingerprint:
+        return snapshot_file, False
+
     snapshot = {
         "date_utc": date_utc,
         "total_free_models": len(current_models),
-        "new_model_ids": sorted(diff["new"].keys()),
-        "removed_model_ids": sorted(diff["removed"].keys()),
-        "model_ids": sorted(current_models.keys()),
+        "new_model_ids": diff["new_ids"],
+        "removed_model_ids": diff["removed_ids"],
+        "model_ids": current_ids,
         "models": current_models,
     }
 
-    if snapshot_file.exists():
-        with snapshot_file.open("r", encoding="utf-8") as file:
-            existing = json.load(file)
-        if existing == snapshot:
-            return snapshot_file, False
+    updated = atomic_write_if_changed(snapshot_file, dumps_json(snapshot), digest=fingerprint)
+    return snapshot_file, updated
 
-    with snapshot_file.open("w", encoding="utf-8") as file:
-        json.dump(snapshot, file, ensure_ascii=False, indent=2, sort_keys=True)
 
-    return snapshot_file, True
+def set_github_output(name: str, value: str) -> None:
+    if "\n" in value:
+        GITHUB_OUTPUT_BUFFER.append(f"{name}<<EOF\n{value}\nEOF\n")
+    else:
+        GITHUB_OUTPUT_BUFFER.append(f"{name}={value}\n")
 
 
-def set_github_output(name: str, value: str) -> None:
+def flush_github_output() -> None:
+    pending = "".join(GITHUB_OUTPUT_BUFFER)
+    GITHUB_OUTPUT_BUFFER.clear()
+
     github_output = os.environ.get("GITHUB_OUTPUT")
-    if not github_output:
+    if not github_output or not pending:
         return
 
     with open(github_output, "a", encoding="utf-8") as file:
-        if "\n" in value:
-            file.write(f"{name}<<EOF\n{value}\nEOF\n")
-        else:
-            file.write(f"{name}={value}\n")
+        file.write(pending)
 
 
 def main() -> int:
+    try:
+        return run_check()
+    finally:
+        flush_github_output()
+
+
+def run_check() -> int:
     print("Checking OpenRouter free models...")
 
+    known_models = load_known_models()
+
     try:
-        current_models = get_free_models()
+        current_ids, current_models, fetch_cache = get_free_models(known_models)
     except Exception as exc:  # pragma: no cover - runtime integration path
         print(f"Failed to fetch model list: {exc}")
         raise
 
     print(f"Detected free models: {len(current_models)}")
 
-    known_data = load_known_models()
-    known_models = known_data.get("models", {})
-    if not isinstance(known_models, dict):
-        known_models = {}
+    known_ids = sorted(known_models.keys())
 
-    diff = compare_models(current_models, known_models)
+    diff = compare_models(current_ids, current_models, known_ids, known_models)
     new_count = len(diff["new"])
     removed_count = len(diff["removed"])
     has_changes = new_count > 0 or removed_count > 0
 
     print(f"Changes - added: {new_count}, removed: {removed_count}")
 
-    write_model_changes_file(diff, current_models)
-    save_known_models(current_models)
-    snapshot_path, snapshot_updated = save_daily_snapshot(diff, current_models)
-    model_layer_updated = save_model_layer(build_model_layer(current_models))
+    # One timestamp for the whole run keeps the artifacts consistent.
+    run_ts = now_utc()
+    run_ts_iso = iso_utc(run_ts)
+    date_utc = run_ts.strftime("%Y-%m-%d")
+
+    model_changes_updated = write_model_changes_file(diff, current_models, run_ts_iso)
+    known_models_updated = save_known_models(current_models, run_ts_iso)
+    # Saved only after the baseline it validates has been written.
+    fetch_cache_updated = save_fetch_cache(fetch_cache)
+    snapshot_path, snapshot_updated = save_daily_snapshot(date_utc, diff, current_ids, current_models)
+    model_layer_updated = save_model_layer(build_model_layer(current_ids, current_models), run_ts_iso)
 
     set_github_output("has_changes", str(has_changes).lower())
     set_github_output("new_count", str(new_count))
     set_github_output("removed_count", str(removed_count))
     set_github_output("total_count", str(len(current_models)))
+    set_github_output("known_models_updated", str(known_models_updated).lower())
+    set_github_output("model_changes_updated", str(model_changes_updated).lower())
+    set_github_output("fetch_cache_updated", str(fetch_cache_updated).lower())
     set_github_output("snapshot_path", str(snapshot_path))
     set_github_output("snapshot_updated", str(snapshot_updated).lower())
     set_github_output("model_layer_path", str(MODEL_LAYER_FILE))
     set_github_output("model_layer_updated", str(model_layer_updated).lower())
 
     if has_changes:
-        issue_title = f"OpenRouter free model updates ({now_utc().strftime('%Y-%m-%d')})"
-        issue_body = create_issue_content(diff, current_models)
+        issue_title = f"OpenRouter free model updates ({date_utc})"
+        issue_body = create_issue_content(diff, current_ids, current_models, run_ts)
         set_github_output("issue_title", issue_title)
         set_github_output("issue_body", issue_body)
 